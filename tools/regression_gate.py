@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""Compare stock Druid against the hot-swapped override jars with interleaved query runs."""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+
+OVERRIDES_RELATIVE_PATH = Path("druid-runtime") / "overrides"
+# An always-empty directory inside the overrides mount; hotswap.py only manages top-level jars.
+BASELINE_DIRNAME = ".baseline"
+BASELINE_OVERRIDES = f"/opt/druid/overrides/{BASELINE_DIRNAME}/*"
+PATCHED_OVERRIDES = "/opt/druid/overrides/*"
+NON_DRUID_SERVICES = {"zookeeper", "metadata-storage"}
+NO_CACHE_CONTEXT = {"useCache": False, "populateCache": False, "useResultLevelCache": False}
+
+DEFAULT_SUITE: List[dict] = [
+    {
+        "name": "wikipedia-count",
+        "sql": "SELECT COUNT(*) FROM wikipedia",
+    },
+    {
+        "name": "wikipedia-topn-channel",
+        "sql": "SELECT channel, SUM(added) AS added FROM wikipedia GROUP BY 1 ORDER BY 2 DESC LIMIT 10",
+    },
+    {
+        "name": "wikipedia-hourly-timeseries",
+        "sql": "SELECT TIME_FLOOR(__time, 'PT1H') AS hour, COUNT(*), SUM(delta) FROM wikipedia GROUP BY 1",
+    },
+    {
+        "name": "wikipedia-filtered-groupby",
+        "sql": (
+            "SELECT page, COUNT(*) AS edits FROM wikipedia WHERE countryName = 'United States' "
+            "GROUP BY 1 ORDER BY 2 DESC LIMIT 20"
+        ),
+    },
+    {
+        "name": "conversations-contains-string",
+        "sql": "SELECT COUNT(*) FROM \"conversations-2\" WHERE CONTAINS_STRING(utterances, 'dog')",
+    },
+    {
+        "name": "conversations-groupby-split",
+        "sql": "SELECT split, SUM(message_count) FROM \"conversations-2\" GROUP BY 1",
+    },
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Alternate the stack between stock apache/druid jars and the jars in "
+            "druid-runtime/overrides, run a fixed query suite against each over several "
+            "rounds, and exit nonzero when the patched build is significantly slower."
+        )
+    )
+    parser.add_argument(
+        "--router-url",
+        default="http://localhost:8888",
+        help="Base URL used to issue queries (default: http://localhost:8888).",
+    )
+    parser.add_argument(
+        "--broker-url",
+        default="http://localhost:8082",
+        help="Base URL polled for broker readiness (default: http://localhost:8082).",
+    )
+    parser.add_argument(
+        "--coordinator-url",
+        default="http://localhost:8081",
+        help="Base URL for the Druid Coordinator API (default: http://localhost:8081).",
+    )
+    parser.add_argument(
+        "--suite",
+        type=Path,
+        help=(
+            "JSON file with a list of {\"name\", \"sql\"} or {\"name\", \"native\"} entries. "
+            "Defaults to a built-in suite over wikipedia and conversations-2."
+        ),
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=6,
+        help="Number of baseline/patched pairs to run; order alternates every round (default: 6).",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=5,
+        help="Timed executions of each query per run; the run's median is one sample (default: 5).",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=3,
+        help="Untimed executions of each query after every restart (default: 3).",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="Family-wise significance level, Bonferroni-corrected across queries (default: 0.05).",
+    )
+    parser.add_argument(
+        "--min-slowdown",
+        type=float,
+        default=0.05,
+        help="Ignore regressions whose median slowdown is below this fraction (default: 0.05).",
+    )
+    parser.add_argument(
+        "--ready-timeout",
+        type=float,
+        default=600.0,
+        help="Seconds to wait for the stack and segments after each restart (default: 600).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write the JSON report (default: sessions/regression-gate-<timestamp>.json).",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for shuffling query order within a run (default: 0).",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repo_root = Path(__file__).resolve().parent.parent
+    overrides_dir = repo_root / OVERRIDES_RELATIVE_PATH
+
+    if not 0 < args.alpha < 1:
+        print("--alpha must be between 0 and 1.", file=sys.stderr)
+        return 2
+    suite = load_suite(args.suite)
+    corrected_alpha = args.alpha / max(len(suite), 1)
+    # The exact one-sided test can never go below 1/C(2n, n) with n samples per side, so
+    # too few rounds would make the gate pass no matter how slow the patch is.
+    min_p_value = 1 / math.comb(2 * max(args.rounds, 0), max(args.rounds, 0))
+    if min_p_value >= corrected_alpha:
+        needed = next(n for n in itertools.count(1) if 1 / math.comb(2 * n, n) < corrected_alpha)
+        print(
+            f"--rounds {args.rounds} cannot detect a regression: the smallest possible p-value "
+            f"{min_p_value:.4f} is not below alpha {args.alpha} / {len(suite)} queries = "
+            f"{corrected_alpha:.4f}. Use at least --rounds {needed}.",
+            file=sys.stderr,
+        )
+        return 2
+
+    if not sorted(overrides_dir.glob("*.jar")):
+        print(
+            f"No override jars found in {overrides_dir}; run tools/hotswap.py first.",
+            file=sys.stderr,
+        )
+        return 2
+    (overrides_dir / BASELINE_DIRNAME).mkdir(parents=True, exist_ok=True)
+
+    compose_cmd = _resolve_compose_command()
+    if compose_cmd is None:
+        print("docker compose is required to switch between builds.", file=sys.stderr)
+        return 2
+    services = _druid_services(compose_cmd, repo_root)
+
+    rng = random.Random(args.seed)
+    variants = {"baseline": BASELINE_OVERRIDES, "patched": PATCHED_OVERRIDES}
+    samples: Dict[str, Dict[str, List[float]]] = {
+        variant: {entry["name"]: [] for entry in suite} for variant in variants
+    }
+
+    start = time.perf_counter()
+    current = None
+    recreating = False
+    try:
+        for round_index in range(args.rounds):
+            order = ["baseline", "patched"] if round_index % 2 == 0 else ["patched", "baseline"]
+            for variant in order:
+                log_heading(f"Round {round_index + 1}/{args.rounds}", variant)
+                # A recreate that fails partway can leave services on either build.
+                current = variant
+                recreating = True
+                recreate_stack(compose_cmd, repo_root, services, variants[variant])
+                recreating = False
+                wait_until_ready(args.broker_url, args.coordinator_url, args.ready_timeout)
+                medians = run_suite(args.router_url, suite, args.warmup, args.iterations, rng)
+                for name, median in medians.items():
+                    samples[variant][name].append(median)
+                    print(f"  {name}: {median * 1000:.1f} ms")
+    except RuntimeError as exc:
+        print(str(exc), file=sys.stderr)
+        return 2
+    finally:
+        if current != "patched" or recreating:
+            log_heading("Restoring patched overrides")
+            try:
+                recreate_stack(compose_cmd, repo_root, services, PATCHED_OVERRIDES)
+            except RuntimeError as exc:
+                print(
+                    f"  warning: {exc}; some services may still run stock jars. "
+                    "Run `docker compose up -d --force-recreate` to restore the overrides.",
+                    file=sys.stderr,
+                )
+
+    results = []
+    regressions = []
+    for entry in suite:
+        name = entry["name"]
+        baseline = samples["baseline"][name]
+        patched = samples["patched"][name]
+        ratio = statistics.median(patched) / statistics.median(baseline)
+        p_value = mann_whitney_greater(patched, baseline)
+        regressed = p_value < corrected_alpha and ratio > 1.0 + args.min_slowdown
+        results.append(
+            {
+                "name": name,
+                "baseline_median_ms": round(statistics.median(baseline) * 1000, 3),
+                "patched_median_ms": round(statistics.median(patched) * 1000, 3),
+                "ratio": round(ratio, 4),
+                "p_value": p_value,
+                "regression": regressed,
+                "baseline_samples_ms": [round(value * 1000, 3) for value in baseline],
+                "patched_samples_ms": [round(value * 1000, 3) for value in patched],
+            }
+        )
+        if regressed:
+            regressions.append(name)
+
+    log_heading("Results", f"alpha {args.alpha} / {len(suite)} queries = {corrected_alpha:.4f}")
+    for result in results:
+        marker = "REGRESSION" if result["regression"] else "ok"
+        print(
+            f"  {result['name']}: {result['baseline_median_ms']} ms -> {result['patched_median_ms']} ms "
+            f"(x{result['ratio']}, p={result['p_value']:.4f}) {marker}"
+        )
+
+    report = {
+        "rounds": args.rounds,
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+        "alpha": args.alpha,
+        "corrected_alpha": corrected_alpha,
+        "min_slowdown": args.min_slowdown,
+        "overrides": sorted(jar.name for jar in overrides_dir.glob("*.jar")),
+        "queries": results,
+        "regressions": regressions,
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+    }
+    output = args.output or (
+        repo_root
+        / "sessions"
+        / f"regression-gate-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nReport written to {output}")
+    return 1 if regressions else 0
+
+
+def load_suite(path: Path | None) -> List[dict]:
+    if path is None:
+        return DEFAULT_SUITE
+    suite = json.loads(path.read_text(encoding="utf-8"))
+    for index, entry in enumerate(suite):
+        if "sql" not in entry and "native" not in entry:
+            raise SystemExit(f"Suite entry {index} in {path} needs a 'sql' or 'native' query.")
+        entry.setdefault("name", f"query-{index}")
+    return suite
+
+
+def run_suite(
+    router_url: str,
+    suite: Sequence[dict],
+    warmup: int,
+    iterations: int,
+    rng: random.Random,
+) -> Dict[str, float]:
+    for _ in range(warmup):
+        for entry in suite:
+            run_query(router_url, entry)
+    timings: Dict[str, List[float]] = {entry["name"]: [] for entry in suite}
+    for _ in range(iterations):
+        ordered = list(suite)
+        rng.shuffle(ordered)
+        for entry in ordered:
+            timings[entry["name"]].append(run_query(router_url, entry))
+    return {name: statistics.median(values) for name, values in timings.items()}
+
+
+def run_query(router_url: str, entry: dict) -> float:
+    """Execute one suite entry with caches disabled and return its wall time in seconds."""
+    if "sql" in entry:
+        path = "/druid/v2/sql"
+        body = {"query": entry["sql"], "context": {**NO_CACHE_CONTEXT, **entry.get("context", {})}}
+    else:
+        path = "/druid/v2"
+        native = dict(entry["native"])
+        native["context"] = {**NO_CACHE_CONTEXT, **native.get("context", {})}
+        body = native
+    start = time.perf_counter()
+    _post_json(router_url, path, body, timeout=300)
+    return time.perf_counter() - start
+
+
+def mann_whitney_greater(x: Sequence[float], y: Sequence[float]) -> float:
+    """One-sided Mann-Whitney U p-value for the alternative that ``x`` tends to exceed ``y``."""
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        return 1.0
+    u = sum(1.0 if a > b else 0.5 if a == b else 0.0 for a in x for b in y)
+    has_ties = len(set(x) | set(y)) < n + m
+    if not has_ties and n * m <= 2500:
+        counts = _u_distribution(n, m)
+        total = sum(counts)
+        return sum(counts[int(u):]) / total
+
+    combined = sorted(list(x) + list(y))
+    tie_term = 0.0
+    index = 0
+    while index < len(combined):
+        run = 1
+        while index + run < len(combined) and combined[index + run] == combined[index]:
+            run += 1
+        tie_term += run**3 - run
+        index += run
+    total = n + m
+    variance = n * m / 12.0 * ((total + 1) - tie_term / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n * m / 2.0 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _u_distribution(n: int, m: int) -> List[int]:
+    """Number of orderings producing each U statistic for sample sizes ``n`` and ``m``."""
+    # counts[i][j][u]: orderings of i x-values and j y-values whose U equals u.
+    previous = [[1] for _ in range(m + 1)]
+    for i in range(1, n + 1):
+        current = [[1]]
+        for j in range(1, m + 1):
+            size = i * j + 1
+            merged = [0] * size
+            # The largest element is either an x (beating all j y-values) or a y.
+            for u, count in enumerate(previous[j]):
+                merged[u + j] += count
+            for u, count in enumerate(current[j - 1]):
+                merged[u] += count
+            current.append(merged)
+        previous = current
+    return previous[m]
+
+
+def recreate_stack(
+    compose_cmd: Sequence[str],
+    repo_root: Path,
+    services: Sequence[str],
+    overrides: str,
+) -> None:
+    env = dict(os.environ, DRUID_OVERRIDES=overrides)
+    cmd = list(compose_cmd) + ["up", "-d", "--force-recreate", "--no-deps", *services]
+    try:
+        subprocess.run(cmd, cwd=repo_root, env=env, check=True)
+    except subprocess.CalledProcessError as exc:
+        raise RuntimeError(f"docker compose up failed with exit code {exc.returncode}") from exc
+
+
+def wait_until_ready(broker_url: str, coordinator_url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            load_status = _get_json(coordinator_url, "/druid/coordinator/v1/loadstatus")
+            _get_json(broker_url, "/druid/broker/v1/readiness")
+            if load_status is not None and all(percent >= 100.0 for percent in load_status.values()):
+                return
+        except RuntimeError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Stack was not ready with all segments loaded after {timeout:.0f}s.")
+        time.sleep(5.0)
+
+
+def _druid_services(compose_cmd: Sequence[str], repo_root: Path) -> List[str]:
+    result = subprocess.run(
+        list(compose_cmd) + ["config", "--services"],
+        cwd=repo_root,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return [
+        line.strip()
+        for line in result.stdout.splitlines()
+        if line.strip() and line.strip() not in NON_DRUID_SERVICES
+    ]
+
+
+def _get_json(base_url: str, path: str):
+    return _request(base_url, path, None, timeout=30)
+
+
+def _post_json(base_url: str, path: str, body: dict, timeout: float):
+    return _request(base_url, path, json.dumps(body).encode("utf-8"), timeout=timeout)
+
+
+def _request(base_url: str, path: str, data: bytes | None, timeout: float):
+    endpoint = base_url.rstrip("/") + path
+    request = urllib.request.Request(
+        endpoint,
+        data=data,
+        headers={"Content-Type": "application/json"},
+        method="POST" if data is not None else "GET",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            raw = response.read()
+    except urllib.error.HTTPError as exc:
+        details = exc.read().decode("utf-8", "replace")
+        raise RuntimeError(f"Request to {endpoint} failed ({exc.code}): {details}") from exc
+    except urllib.error.URLError as exc:
+        raise RuntimeError(f"Request to {endpoint} failed: {exc}") from exc
+    return json.loads(raw) if raw.strip() else None
+
+
+def _resolve_compose_command() -> List[str] | None:
+    if shutil.which("docker"):
+        return ["docker", "compose"]
+    if shutil.which("docker-compose"):
+        return ["docker-compose"]
+    return None
+
+
+def log_heading(title: str, detail: str | None = None) -> None:
+    if detail:
+        print(f"\n==> {title}: {detail}")
+    else:
+        print(f"\n==> {title}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        raise SystemExit("Interrupted")
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""Replay queries captured by the broker's file request logger with their original timing."""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence
+
+
+REQUEST_LOGS_RELATIVE_PATH = Path("druid-runtime") / "storage" / "request-logs"
+# Context keys that identify the original execution and would collide on replay.
+DROPPED_CONTEXT_KEYS = {"queryId", "sqlQueryId", "nativeQueryIds", "remoteAddress"}
+# Added to every replayed query so later runs can tell replays from captured traffic.
+REPLAY_CONTEXT_KEY = "replayedBy"
+REPLAY_CONTEXT_VALUE = "tools/replay_queries.py"
+# Native query fields whose values describe the query shape rather than its parameters.
+SHAPE_KEYS = {"type", "queryType", "dimension", "fieldName", "name", "outputName", "granularity", "ordering"}
+SQL_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMBER_LITERAL = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?(?![\w\"])")
+SQL_LINE_COMMENT = re.compile(r"--[^\n]*")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Parse request logs written by the broker's file request logger, re-issue the "
+            "captured SQL and native queries while preserving their inter-arrival times and "
+            "concurrency, and report latency per query shape."
+        )
+    )
+    parser.add_argument(
+        "--log-dir",
+        type=Path,
+        help="Directory holding request logs (default: druid-runtime/storage/request-logs).",
+    )
+    parser.add_argument(
+        "--router-url",
+        default="http://localhost:8888",
+        help="Base URL the captured queries are replayed against (default: http://localhost:8888).",
+    )
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=1.0,
+        help="Compress the original inter-arrival times by this factor (default: 1.0).",
+    )
+    parser.add_argument(
+        "--since",
+        help="Only replay queries logged at or after this ISO-8601 timestamp.",
+    )
+    parser.add_argument(
+        "--until",
+        help="Only replay queries logged before this ISO-8601 timestamp.",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Replay at most this many queries.",
+    )
+    parser.add_argument(
+        "--include-sql-native",
+        action="store_true",
+        help=(
+            "Also replay the native queries the broker planned from SQL. They are skipped by "
+            "default because replaying the SQL already issues them."
+        ),
+    )
+    parser.add_argument(
+        "--include-replayed",
+        action="store_true",
+        help=(
+            "Also replay queries logged by earlier replays. They are skipped by default so "
+            "repeated runs only re-issue the originally captured traffic."
+        ),
+    )
+    parser.add_argument(
+        "--include-internal",
+        action="store_true",
+        help=(
+            "Also replay native queries with no remote address, such as the broker's own "
+            "segmentMetadata refreshes. They are skipped by default as they are not user traffic."
+        ),
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=64,
+        help="Upper bound on in-flight replayed queries (default: 64).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write the JSON report (default: sessions/replay-<timestamp>.json).",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Parse the logs and print the captured query shapes without replaying them.",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repo_root = Path(__file__).resolve().parent.parent
+    log_dir = args.log_dir or repo_root / REQUEST_LOGS_RELATIVE_PATH
+    if args.speedup <= 0:
+        print("--speedup must be positive.", file=sys.stderr)
+        return 1
+
+    log_files = sorted(log_dir.glob("*.log")) if log_dir.exists() else []
+    if not log_files:
+        print(
+            f"No request logs found in {log_dir}. Request logging is configured in the broker's "
+            "runtime.properties; restart the broker and run some queries first.",
+            file=sys.stderr,
+        )
+        return 1
+
+    try:
+        since = _parse_timestamp(args.since) if args.since else None
+        until = _parse_timestamp(args.until) if args.until else None
+    except ValueError as exc:
+        print(f"--since/--until must be ISO-8601 timestamps: {exc}", file=sys.stderr)
+        return 1
+    events = [
+        event
+        for event in parse_request_logs(
+            log_files,
+            include_sql_native=args.include_sql_native,
+            include_replayed=args.include_replayed,
+            include_internal=args.include_internal,
+        )
+        if (since is None or event["timestamp"] >= since) and (until is None or event["timestamp"] < until)
+    ]
+    events.sort(key=lambda event: event["timestamp"])
+    if args.limit is not None:
+        events = events[: args.limit]
+    if not events:
+        print("No queries matched the selected window.", file=sys.stderr)
+        return 1
+
+    duration = (events[-1]["timestamp"] - events[0]["timestamp"]).total_seconds()
+    log_heading(
+        "Parsed request logs",
+        f"{len(events)} queries over {duration:.1f}s from {len(log_files)} file(s)",
+    )
+    if args.dry_run:
+        for shape, members in sorted(_group(events).items()):
+            print(f"  {shape}: {len(members)}x  {members[0]['display']}")
+        return 0
+
+    log_heading("Replaying", f"{args.router_url.rstrip('/')} at {args.speedup}x")
+    results = replay(events, args.router_url, args.speedup, args.max_concurrency)
+
+    shapes = summarize(results)
+    log_heading("Latency by query shape")
+    for shape in shapes:
+        print(
+            f"  {shape['shape']}: n={shape['count']} errors={shape['errors']} "
+            f"p50={shape['p50_ms']} ms p95={shape['p95_ms']} ms "
+            f"(captured p50={shape['captured_p50_ms']} ms)  {shape['example']}"
+        )
+
+    lateness = [result["lateness_seconds"] for result in results]
+    report = {
+        "log_files": [path.name for path in log_files],
+        "router_url": args.router_url,
+        "speedup": args.speedup,
+        "queries": len(results),
+        "errors": sum(1 for result in results if not result["success"]),
+        "captured_duration_seconds": round(duration, 3),
+        "captured_peak_concurrency": peak_concurrency(
+            (
+                (event["timestamp"] - events[0]["timestamp"]).total_seconds(),
+                (event["captured_ms"] or 0) / 1000.0,
+            )
+            for event in events
+        ),
+        "replay_peak_concurrency": peak_concurrency(
+            (result["started_seconds"], result["latency_ms"] / 1000.0) for result in results
+        ),
+        "max_lateness_seconds": round(max(lateness), 3),
+        "shapes": shapes,
+    }
+    output = args.output or (
+        repo_root / "sessions" / f"replay-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(
+        f"\nReplayed {report['queries']} queries ({report['errors']} errors); peak concurrency "
+        f"{report['replay_peak_concurrency']} vs {report['captured_peak_concurrency']} captured; "
+        f"max lateness {report['max_lateness_seconds']}s. Report written to {output}"
+    )
+    return 0 if report["errors"] == 0 else 1
+
+
+def parse_request_logs(
+    paths: Sequence[Path],
+    include_sql_native: bool = False,
+    include_replayed: bool = False,
+    include_internal: bool = False,
+) -> List[dict]:
+    """Parse file request logger lines into replayable events.
+
+    Native lines are ``timestamp, remoteAddr, query, queryStats``; SQL lines leave the
+    query field empty and append ``{"query": sql, "context": ...}`` after the stats.
+    Queries the broker issues itself, such as segmentMetadata refreshes, have no remoteAddr.
+    """
+    events: List[dict] = []
+    for path in paths:
+        with path.open("r", encoding="utf-8", errors="replace") as handle:
+            for line_number, line in enumerate(handle, start=1):
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 4:
+                    continue
+                try:
+                    timestamp = _parse_timestamp(fields[0])
+                    stats = json.loads(fields[3]) if fields[3] else {}
+                    if not fields[2] and len(fields) >= 5:
+                        sql = json.loads(fields[4])
+                        if _is_replayed(sql.get("context")) and not include_replayed:
+                            continue
+                        event = _sql_event(sql, stats)
+                    else:
+                        if not fields[1] and not include_internal:
+                            continue
+                        native = json.loads(fields[2])
+                        context = native.get("context") or {}
+                        if "sqlQueryId" in context and not include_sql_native:
+                            continue
+                        if _is_replayed(context) and not include_replayed:
+                            continue
+                        event = _native_event(native, stats)
+                except (ValueError, AttributeError) as exc:
+                    print(f"  warning: skipping {path.name}:{line_number}: {exc}", file=sys.stderr)
+                    continue
+                event["timestamp"] = timestamp
+                events.append(event)
+    return events
+
+
+def _sql_event(sql: dict, stats: dict) -> dict:
+    text = sql.get("query") or ""
+    context = {k: v for k, v in (sql.get("context") or {}).items() if k not in DROPPED_CONTEXT_KEYS}
+    context[REPLAY_CONTEXT_KEY] = REPLAY_CONTEXT_VALUE
+    normalized = normalize_sql(text)
+    return {
+        "kind": "sql",
+        "path": "/druid/v2/sql",
+        "body": {"query": text, "context": context},
+        "shape": "sql:" + _digest(normalized),
+        "display": _truncate(normalized),
+        "captured_ms": stats.get("sqlQuery/time", stats.get("query/time")),
+        "captured_success": stats.get("success", True),
+    }
+
+
+def _native_event(native: dict, stats: dict) -> dict:
+    body = dict(native)
+    body["context"] = {
+        k: v for k, v in (native.get("context") or {}).items() if k not in DROPPED_CONTEXT_KEYS
+    }
+    body["context"][REPLAY_CONTEXT_KEY] = REPLAY_CONTEXT_VALUE
+    skeleton = native_shape(native)
+    datasource = _datasource_name(native.get("dataSource"))
+    return {
+        "kind": "native",
+        "path": "/druid/v2",
+        "body": body,
+        "shape": f"native:{native.get('queryType')}:{datasource}:" + _digest(json.dumps(skeleton, sort_keys=True)),
+        "display": f"{native.get('queryType')} on {datasource}",
+        "captured_ms": stats.get("query/time"),
+        "captured_success": stats.get("success", True),
+    }
+
+
+def _is_replayed(context) -> bool:
+    return isinstance(context, dict) and REPLAY_CONTEXT_KEY in context
+
+
+def normalize_sql(text: str) -> str:
+    """Replace literals and collapse whitespace so queries differing only in parameters match."""
+    text = SQL_LINE_COMMENT.sub(" ", text)
+    text = SQL_STRING_LITERAL.sub("?", text)
+    text = SQL_NUMBER_LITERAL.sub("?", text)
+    return " ".join(text.split())
+
+
+def native_shape(value, key: str | None = None):
+    """Reduce a native query to its structure, dropping intervals, context and literal values."""
+    if isinstance(value, dict):
+        return {
+            k: native_shape(v, k)
+            for k, v in sorted(value.items())
+            if k not in {"intervals", "context", "limit", "threshold"}
+        }
+    if isinstance(value, list):
+        return [native_shape(item, key) for item in value]
+    if key in SHAPE_KEYS or key == "dataSource":
+        return value
+    return type(value).__name__
+
+
+def replay(events: Sequence[dict], router_url: str, speedup: float, max_concurrency: int) -> List[dict]:
+    origin = events[0]["timestamp"]
+    results: List[dict] = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def execute(event: dict, scheduled: float) -> None:
+        started = time.perf_counter() - start
+        begin = time.perf_counter()
+        success = True
+        error = None
+        try:
+            _post_json(router_url, event["path"], event["body"])
+        except RuntimeError as exc:
+            success = False
+            error = str(exc)[:500]
+        latency = time.perf_counter() - begin
+        with lock:
+            results.append(
+                {
+                    "shape": event["shape"],
+                    "display": event["display"],
+                    "started_seconds": started,
+                    "lateness_seconds": max(started - scheduled, 0.0),
+                    "latency_ms": latency * 1000.0,
+                    "captured_ms": event["captured_ms"],
+                    "success": success,
+                    "error": error,
+                }
+            )
+
+    with ThreadPoolExecutor(max_workers=max(max_concurrency, 1)) as pool:
+        for index, event in enumerate(events, start=1):
+            scheduled = (event["timestamp"] - origin).total_seconds() / speedup
+            delay = scheduled - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(execute, event, scheduled)
+            if index % 100 == 0:
+                print(f"  issued {index}/{len(events)}")
+    return results
+
+
+def summarize(results: Sequence[dict]) -> List[dict]:
+    shapes = []
+    for shape, members in _group(results).items():
+        latencies = sorted(member["latency_ms"] for member in members if member["success"])
+        captured = sorted(member["captured_ms"] for member in members if member["captured_ms"] is not None)
+        shapes.append(
+            {
+                "shape": shape,
+                "example": members[0]["display"],
+                "count": len(members),
+                "errors": sum(1 for member in members if not member["success"]),
+                "p50_ms": _percentile(latencies, 50),
+                "p95_ms": _percentile(latencies, 95),
+                "max_ms": round(latencies[-1], 1) if latencies else None,
+                "mean_ms": round(statistics.fmean(latencies), 1) if latencies else None,
+                "captured_p50_ms": _percentile(captured, 50),
+                "captured_p95_ms": _percentile(captured, 95),
+                "first_error": next((member["error"] for member in members if member["error"]), None),
+            }
+        )
+    shapes.sort(key=lambda item: item["count"], reverse=True)
+    return shapes
+
+
+def peak_concurrency(intervals: Iterable[tuple[float, float]]) -> int:
+    """Largest number of overlapping ``(start, duration)`` intervals."""
+    edges = []
+    for begin, duration in intervals:
+        edges.append((begin, 1))
+        edges.append((begin + duration, -1))
+    edges.sort(key=lambda edge: (edge[0], edge[1]))
+    peak = current = 0
+    for _, delta in edges:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def _group(items: Iterable[dict]) -> Dict[str, List[dict]]:
+    grouped: Dict[str, List[dict]] = {}
+    for item in items:
+        grouped.setdefault(item["shape"], []).append(item)
+    return grouped
+
+
+def _percentile(values: Sequence[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    index = min(int(round(percentile / 100.0 * (len(values) - 1))), len(values) - 1)
+    return round(values[index], 1)
+
+
+def _datasource_name(datasource) -> str:
+    if isinstance(datasource, str):
+        return datasource
+    if isinstance(datasource, dict):
+        if "name" in datasource:
+            return str(datasource["name"])
+        if datasource.get("type") == "query":
+            return _datasource_name((datasource.get("query") or {}).get("dataSource"))
+        return str(datasource.get("type", "unknown"))
+    return "unknown"
+
+
+def _parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:8]
+
+
+def _truncate(value: str, limit: int = 100) -> str:
+    return value if len(value) <= limit else value[: limit - 3] + "..."
+
+
+def _post_json(base_url: str, path: str, body: dict):
+    endpoint = base_url.rstrip("/") + path
+    request = urllib.request.Request(
+        endpoint,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return response.read()
+    except urllib.error.HTTPError as exc:
+        details = exc.read().decode("utf-8", "replace")
+        raise RuntimeError(f"Query failed ({exc.code}): {details}") from exc
+    except urllib.error.URLError as exc:
+        raise RuntimeError(f"Query failed: {exc}") from exc
+
+
+def log_heading(title: str, detail: str | None = None) -> None:
+    if detail:
+        print(f"\n==> {title}: {detail}")
+    else:
+        print(f"\n==> {title}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        raise SystemExit("Interrupted")
@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+"""Sample per-container CPU, memory, heap and GC while a workload runs and render a timeline."""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from replay_queries import parse_request_logs
+
+
+REQUEST_LOGS_RELATIVE_PATH = Path("druid-runtime") / "storage" / "request-logs"
+HSPERFDATA_MAGIC = 0xCAFEC0C0
+SPARK_CHARS = " ▁▂▃▄▅▆▇█"
+SATURATION_THRESHOLD = 0.9
+SAMPLE_FIELDS = [
+    "t",
+    "container",
+    "pid",
+    "jvm",
+    "cpu_usage_seconds",
+    "cpu_limit_cores",
+    "mem_bytes",
+    "mem_limit_bytes",
+    "heap_used_bytes",
+    "heap_committed_bytes",
+    "heap_max_bytes",
+    "young_gc_count",
+    "young_gc_seconds",
+    "full_gc_count",
+    "full_gc_seconds",
+    "direct_bytes",
+]
+NMT_OTHER = re.compile(r"-\s+Other \(reserved=(\d+)KB, committed=(\d+)KB\)")
+
+# Runs inside each container. cgroup v2 and v1 files are both tried, and every JVM's
+# hsperfdata file (the counters jstat reads) is appended last as raw bytes behind a
+# header carrying its pid and size. The middleManager runs one JVM per peon next to
+# its own, so each JVM is sampled separately. jcmd only exists on JDK images; when
+# present it reports direct buffers through NMT.
+PROBE_SCRIPT = r"""
+for f in /sys/fs/cgroup/cpu.stat /sys/fs/cgroup/cpu.max /sys/fs/cgroup/memory.current \
+         /sys/fs/cgroup/memory.max /sys/fs/cgroup/cpuacct/cpuacct.usage \
+         /sys/fs/cgroup/memory/memory.usage_in_bytes /sys/fs/cgroup/memory/memory.limit_in_bytes; do
+  [ -r "$f" ] && { echo "## $f"; cat "$f"; }
+done
+echo "## nproc"; nproc 2>/dev/null
+echo "## meminfo"; head -n 1 /proc/meminfo
+if [ -n "$NMT" ] && command -v jcmd >/dev/null 2>&1; then
+  for f in /tmp/hsperfdata_*/*; do
+    [ -f "$f" ] && { echo "## nmt ${f##*/}"; jcmd "${f##*/}" VM.native_memory summary 2>/dev/null; }
+  done
+fi
+for f in /tmp/hsperfdata_*/*; do
+  [ -f "$f" ] && { echo "## hsperfdata ${f##*/} $(wc -c < "$f")"; cat "$f"; }
+done
+"""
+HSPERFDATA_HEADER = re.compile(rb"## hsperfdata (\d+) +(\d+)\n")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Poll cgroup stats and JVM heap/GC counters for every compose container at a "
+            "fixed rate, write compact time series into a session directory, and render a "
+            "timeline aligned with query and ingestion throughput."
+        )
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser(
+        "record",
+        help="Sample until --duration elapses, the wrapped command exits, or Ctrl-C.",
+    )
+    record.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds between samples (default: 1.0).",
+    )
+    record.add_argument(
+        "--duration",
+        type=float,
+        help="Stop sampling after this many seconds, terminating the wrapped command if it is still running.",
+    )
+    record.add_argument(
+        "--session-dir",
+        type=Path,
+        help="Directory to write samples into (default: sessions/resources-<timestamp>).",
+    )
+    record.add_argument(
+        "--overlord-url",
+        default="http://localhost:8090",
+        help="Base URL polled for running ingestion tasks (default: http://localhost:8090).",
+    )
+    record.add_argument(
+        "--native-memory",
+        action="store_true",
+        help=(
+            "Also run `jcmd VM.native_memory summary` for direct-buffer usage. Requires a JDK "
+            "image and -XX:NativeMemoryTracking=summary in the service's jvm.config."
+        ),
+    )
+    record.add_argument(
+        "workload",
+        nargs=argparse.REMAINDER,
+        help="Optional command to run while sampling, given after `--`.",
+    )
+
+    render = subparsers.add_parser("render", help="Render the timeline for a recorded session.")
+    render.add_argument("session_dir", type=Path, help="Directory written by `record`.")
+    for subparser in (record, render):
+        subparser.add_argument(
+            "--width",
+            type=int,
+            default=60,
+            help="Number of time buckets in the rendered timeline (default: 60).",
+        )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repo_root = Path(__file__).resolve().parent.parent
+    if args.command == "render":
+        print(render_timeline(args.session_dir, repo_root, args.width))
+        return 0
+    return record(args, repo_root)
+
+
+def record(args: argparse.Namespace, repo_root: Path) -> int:
+    compose_cmd = _resolve_compose_command()
+    if compose_cmd is None:
+        print("docker compose is required to sample containers.", file=sys.stderr)
+        return 1
+    containers = _running_containers(compose_cmd, repo_root)
+    if not containers:
+        print("No running compose containers to sample.", file=sys.stderr)
+        return 1
+
+    workload = list(args.workload)
+    if workload[:1] == ["--"]:
+        workload = workload[1:]
+    # Paths are resolved by Popen against the repo root; bare names must be on PATH.
+    if workload and "/" not in workload[0] and shutil.which(workload[0]) is None:
+        print(f"Workload command not found: {workload[0]}", file=sys.stderr)
+        return 1
+
+    session_dir = args.session_dir or (
+        repo_root / "sessions" / f"resources-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+    )
+    session_dir.mkdir(parents=True, exist_ok=True)
+    started_at = time.time()
+    (session_dir / "meta.json").write_text(
+        json.dumps(
+            {
+                "started_at": started_at,
+                "interval": args.interval,
+                "containers": containers,
+                "workload": workload,
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+
+    log_heading("Sampling", f"{len(containers)} container(s) every {args.interval}s -> {session_dir}")
+    try:
+        process = subprocess.Popen(workload, cwd=repo_root) if workload else None
+    except OSError as exc:
+        print(f"Could not start {workload[0]}: {exc}", file=sys.stderr)
+        return 1
+    samples_path = session_dir / "samples.csv"
+    tasks_path = session_dir / "tasks.csv"
+    count = 0
+    timed_out = False
+    try:
+        with samples_path.open("w", newline="", encoding="utf-8") as samples_handle, tasks_path.open(
+            "w", newline="", encoding="utf-8"
+        ) as tasks_handle, ThreadPoolExecutor(max_workers=len(containers)) as pool:
+            samples_writer = csv.DictWriter(samples_handle, fieldnames=SAMPLE_FIELDS)
+            samples_writer.writeheader()
+            tasks_writer = csv.writer(tasks_handle)
+            tasks_writer.writerow(["t", "running_tasks"])
+            next_tick = time.monotonic()
+            while True:
+                offset = round(time.time() - started_at, 3)
+                for rows in pool.map(
+                    lambda name: probe_container(name, offset, args.native_memory), containers
+                ):
+                    samples_writer.writerows(rows)
+                tasks_writer.writerow([offset, _running_task_count(args.overlord_url)])
+                samples_handle.flush()
+                tasks_handle.flush()
+                count += 1
+
+                if args.duration is not None and offset >= args.duration:
+                    if process is not None and process.poll() is None:
+                        print(f"\n  --duration reached; terminating {workload[0]}")
+                        _stop_workload(process)
+                        timed_out = True
+                    break
+                if process is not None and process.poll() is not None:
+                    break
+                next_tick += args.interval
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.monotonic()
+    except KeyboardInterrupt:
+        print("\n  interrupted; rendering what was collected")
+        if process is not None and process.poll() is None:
+            _stop_workload(process)
+    # A workload cut short by --duration is expected, so it does not fail the recording.
+    returncode = process.wait() if process is not None and not timed_out else 0
+
+    print(f"  collected {count} tick(s)")
+    timeline = render_timeline(session_dir, repo_root, args.width)
+    (session_dir / "timeline.txt").write_text(timeline + "\n", encoding="utf-8")
+    print(timeline)
+    return returncode
+
+
+def _stop_workload(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def probe_container(name: str, offset: float, native_memory: bool) -> List[dict]:
+    """Return one cgroup row for the container followed by one row per JVM running in it."""
+    cmd = ["docker", "exec"]
+    if native_memory:
+        cmd += ["-e", "NMT=1"]
+    cmd += [name, "sh", "-c", PROBE_SCRIPT]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=10)
+    except subprocess.TimeoutExpired:
+        return []
+    if result.returncode != 0 and not result.stdout:
+        return []
+
+    headers = list(HSPERFDATA_HEADER.finditer(result.stdout))
+    text = result.stdout[: headers[0].start()] if headers else result.stdout
+    sections = _split_sections(text.decode("utf-8", "replace"))
+    row: Dict[str, object] = {field: "" for field in SAMPLE_FIELDS}
+    row["t"] = offset
+    row["container"] = name
+    row.update(_cgroup_stats(sections))
+    rows = [row]
+
+    for index, header in enumerate(headers):
+        pid = int(header.group(1))
+        # A JVM that exits between `wc` and `cat` leaves a short payload; never read into the next one.
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(result.stdout)
+        perfdata = result.stdout[header.end() : min(header.end() + int(header.group(2)), end)]
+        try:
+            counters = parse_hsperfdata(perfdata)
+        except (ValueError, struct.error):
+            # Truncated or half-written file; skip this JVM for this tick.
+            continue
+        if not counters:
+            continue
+        jvm_row: Dict[str, object] = {field: "" for field in SAMPLE_FIELDS}
+        jvm_row.update({"t": offset, "container": name, "pid": pid, "jvm": _jvm_label(counters)})
+        jvm_row.update(_jvm_stats(counters))
+        match = NMT_OTHER.search(sections.get(f"nmt {pid}", ""))
+        if match:
+            jvm_row["direct_bytes"] = int(match.group(2)) * 1024
+        rows.append(jvm_row)
+    return rows
+
+
+def parse_hsperfdata(data: bytes) -> Dict[str, object]:
+    """Decode a HotSpot hsperfdata file into ``{counter name: long or string}``."""
+    if len(data) < 32 or struct.unpack_from(">I", data, 0)[0] != HSPERFDATA_MAGIC:
+        return {}
+    order = "<" if data[4] == 1 else ">"
+    entry_offset, num_entries = struct.unpack_from(order + "ii", data, 24)
+    counters: Dict[str, object] = {}
+    offset = entry_offset
+    for _ in range(num_entries):
+        if offset + 20 > len(data):
+            break
+        entry_length, name_offset, vector_length = struct.unpack_from(order + "iii", data, offset)
+        data_type = chr(data[offset + 12])
+        data_offset = struct.unpack_from(order + "i", data, offset + 16)[0]
+        name_start = offset + name_offset
+        name = data[name_start : data.index(b"\0", name_start)].decode("ascii", "replace")
+        value_start = offset + data_offset
+        if vector_length == 0 and data_type == "J":
+            counters[name] = struct.unpack_from(order + "q", data, value_start)[0]
+        elif vector_length > 0 and data_type == "B":
+            raw = data[value_start : value_start + vector_length]
+            counters[name] = raw.split(b"\0", 1)[0].decode("utf-8", "replace")
+        if entry_length <= 0:
+            break
+        offset += entry_length
+    return counters
+
+
+def _jvm_label(counters: Dict[str, object]) -> str:
+    """Name a JVM after its main class, or the Druid node type for ``org.apache.druid.cli.Main``."""
+    command = str(counters.get("sun.rt.javaCommand") or "").split()
+    if not command:
+        return "java"
+    # `Main server historical` and `Main internal peon <task>` both name the process third.
+    if command[0] == "org.apache.druid.cli.Main" and len(command) >= 3:
+        return command[2]
+    return command[0].rsplit(".", 1)[-1]
+
+
+def _jvm_stats(counters: Dict[str, object]) -> Dict[str, object]:
+    if not counters:
+        return {}
+    frequency = counters.get("sun.os.hrt.frequency") or 1
+
+    def total(pattern: re.Pattern) -> int:
+        return sum(value for key, value in counters.items() if pattern.fullmatch(key) and isinstance(value, int))
+
+    # Generations 0 (young) and 1 (old) make up the heap; metaspace is tracked separately.
+    stats: Dict[str, object] = {
+        "heap_used_bytes": total(re.compile(r"sun\.gc\.generation\.[01]\.space\.\d+\.used")),
+        "heap_committed_bytes": total(re.compile(r"sun\.gc\.generation\.[01]\.capacity")),
+        "heap_max_bytes": total(re.compile(r"sun\.gc\.generation\.[01]\.maxCapacity")),
+    }
+    for index, label in ((0, "young"), (1, "full")):
+        invocations = counters.get(f"sun.gc.collector.{index}.invocations")
+        ticks = counters.get(f"sun.gc.collector.{index}.time")
+        if isinstance(invocations, int) and isinstance(ticks, int):
+            stats[f"{label}_gc_count"] = invocations
+            stats[f"{label}_gc_seconds"] = round(ticks / frequency, 4)
+    return stats
+
+
+def _cgroup_stats(sections: Dict[str, str]) -> Dict[str, object]:
+    stats: Dict[str, object] = {}
+    cpu_stat = sections.get("/sys/fs/cgroup/cpu.stat", "")
+    match = re.search(r"^usage_usec (\d+)", cpu_stat, re.MULTILINE)
+    if match:
+        stats["cpu_usage_seconds"] = int(match.group(1)) / 1e6
+    elif sections.get("/sys/fs/cgroup/cpuacct/cpuacct.usage", "").strip().isdigit():
+        stats["cpu_usage_seconds"] = int(sections["/sys/fs/cgroup/cpuacct/cpuacct.usage"]) / 1e9
+
+    cores = None
+    quota = sections.get("/sys/fs/cgroup/cpu.max", "").split()
+    if len(quota) == 2 and quota[0].isdigit():
+        cores = int(quota[0]) / int(quota[1])
+    elif sections.get("nproc", "").strip().isdigit():
+        cores = int(sections["nproc"])
+    stats["cpu_limit_cores"] = cores if cores is not None else ""
+
+    for current_key, limit_key in (
+        ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.max"),
+        ("/sys/fs/cgroup/memory/memory.usage_in_bytes", "/sys/fs/cgroup/memory/memory.limit_in_bytes"),
+    ):
+        current = sections.get(current_key, "").strip()
+        if current.isdigit():
+            stats["mem_bytes"] = int(current)
+            limit = sections.get(limit_key, "").strip()
+            meminfo = re.search(r"(\d+) kB", sections.get("meminfo", ""))
+            host_bytes = int(meminfo.group(1)) * 1024 if meminfo else None
+            if limit.isdigit() and (host_bytes is None or int(limit) < host_bytes):
+                stats["mem_limit_bytes"] = int(limit)
+            elif host_bytes is not None:
+                stats["mem_limit_bytes"] = host_bytes
+            break
+    return stats
+
+
+def _split_sections(text: str) -> Dict[str, str]:
+    sections: Dict[str, str] = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith("## "):
+            current = line[3:].strip()
+            sections[current] = ""
+        elif current is not None:
+            sections[current] += line + "\n"
+    return sections
+
+
+def render_timeline(session_dir: Path, repo_root: Path, width: int) -> str:
+    meta = json.loads((session_dir / "meta.json").read_text(encoding="utf-8"))
+    with (session_dir / "samples.csv").open(newline="", encoding="utf-8") as handle:
+        samples = list(csv.DictReader(handle))
+    if not samples:
+        return "No samples recorded."
+    end = max(float(row["t"]) for row in samples)
+    buckets = max(min(width, int(end / meta["interval"]) + 1), 1)
+    bucket_seconds = max(end, meta["interval"]) / buckets
+
+    def bucket_of(offset: float) -> int:
+        return min(int(offset / bucket_seconds), buckets - 1)
+
+    lines = [
+        f"Timeline for {session_dir.name}: {end:.0f}s in {buckets} bucket(s) of {bucket_seconds:.1f}s; "
+        f"'!' marks series that reached {int(SATURATION_THRESHOLD * 100)}% of their limit.",
+        "",
+    ]
+    label_width = max(len(name) for name in meta["containers"]) + 7
+
+    throughput = _query_throughput(repo_root, meta["started_at"], end, buckets, bucket_seconds)
+    if throughput is not None:
+        lines.append(_series_line("queries/s".ljust(label_width), throughput, None, "q/s"))
+    tasks_path = session_dir / "tasks.csv"
+    if tasks_path.exists():
+        tasks = [0.0] * buckets
+        with tasks_path.open(newline="", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                if row["running_tasks"]:
+                    index = bucket_of(float(row["t"]))
+                    tasks[index] = max(tasks[index], float(row["running_tasks"]))
+        lines.append(_series_line("ingest tasks".ljust(label_width), tasks, None, "tasks"))
+    lines.append("")
+
+    by_container: Dict[str, List[dict]] = {}
+    for row in samples:
+        by_container.setdefault(row["container"], []).append(row)
+    for container in meta["containers"]:
+        rows = [row for row in by_container.get(container, []) if not row.get("pid")]
+        if not rows:
+            continue
+        cpu = [0.0] * buckets
+        mem = [0.0] * buckets
+        cpu_limit = _max_float(rows, "cpu_limit_cores")
+        mem_limit = _max_float(rows, "mem_limit_bytes")
+        for previous, row in zip(rows, rows[1:]):
+            index = bucket_of(float(row["t"]))
+            elapsed = float(row["t"]) - float(previous["t"])
+            if elapsed > 0 and row["cpu_usage_seconds"] and previous["cpu_usage_seconds"]:
+                cores = (float(row["cpu_usage_seconds"]) - float(previous["cpu_usage_seconds"])) / elapsed
+                cpu[index] = max(cpu[index], cores)
+        for row in rows:
+            if row["mem_bytes"]:
+                index = bucket_of(float(row["t"]))
+                mem[index] = max(mem[index], float(row["mem_bytes"]))
+
+        lines.append(container)
+        lines.append(_series_line("  cpu".ljust(label_width), cpu, cpu_limit, "cores"))
+        lines.append(_series_line("  mem".ljust(label_width), mem, mem_limit, "bytes"))
+
+        # GC counters only ever grow within one JVM, so deltas are taken per pid.
+        by_jvm: Dict[str, List[dict]] = {}
+        for row in by_container[container]:
+            if row.get("pid"):
+                by_jvm.setdefault(row["pid"], []).append(row)
+        for pid, jvm_rows in by_jvm.items():
+            heap = [0.0] * buckets
+            gc = [0.0] * buckets
+            heap_limit = _max_float(jvm_rows, "heap_max_bytes")
+            for previous, row in zip(jvm_rows, jvm_rows[1:]):
+                index = bucket_of(float(row["t"]))
+                elapsed = float(row["t"]) - float(previous["t"])
+                if elapsed <= 0:
+                    continue
+                pause = sum(
+                    float(row[key]) - float(previous[key])
+                    for key in ("young_gc_seconds", "full_gc_seconds")
+                    if row[key] and previous[key]
+                )
+                gc[index] = max(gc[index], pause / elapsed)
+            for row in jvm_rows:
+                if row["heap_used_bytes"]:
+                    index = bucket_of(float(row["t"]))
+                    heap[index] = max(heap[index], float(row["heap_used_bytes"]))
+            lines.append(f"  {jvm_rows[0]['jvm']} (pid {pid})")
+            lines.append(_series_line("    heap".ljust(label_width), heap, heap_limit, "bytes"))
+            lines.append(_series_line("    gc".ljust(label_width), gc, None, "pause", scale=1.0))
+            direct = [float(row["direct_bytes"]) for row in jvm_rows if row["direct_bytes"]]
+            if direct:
+                lines.append(f"{'    direct'.ljust(label_width)} peak {_format_value(max(direct), 'bytes')}")
+    return "\n".join(lines)
+
+
+def _series_line(
+    label: str,
+    values: Sequence[float],
+    limit: float | None,
+    unit: str,
+    scale: float | None = None,
+) -> str:
+    peak = max(values) if values else 0.0
+    scale = scale or limit or peak
+    if not scale:
+        bars = SPARK_CHARS[0] * len(values)
+    else:
+        steps = len(SPARK_CHARS) - 1
+        bars = "".join(SPARK_CHARS[min(int(round(value / scale * steps)), steps)] for value in values)
+    saturated = bool(limit) and peak >= SATURATION_THRESHOLD * limit
+    summary = f"peak {_format_value(peak, unit)}"
+    if limit:
+        summary += f" / {_format_value(limit, unit)} ({peak / limit:.0%})"
+    return f"{label} |{bars}| {'!' if saturated else ' '} {summary}"
+
+
+def _format_value(value: float, unit: str) -> str:
+    if unit == "bytes":
+        for suffix in ("B", "KiB", "MiB", "GiB"):
+            if value < 1024 or suffix == "GiB":
+                return f"{value:.1f}{suffix}"
+            value /= 1024
+    if unit == "pause":
+        return f"{value:.0%} of wall time"
+    return f"{value:.1f} {unit}"
+
+
+def _query_throughput(
+    repo_root: Path,
+    started_at: float,
+    end: float,
+    buckets: int,
+    bucket_seconds: float,
+) -> List[float] | None:
+    log_files = sorted((repo_root / REQUEST_LOGS_RELATIVE_PATH).glob("*.log"))
+    if not log_files:
+        return None
+    counts = [0.0] * buckets
+    for event in parse_request_logs(log_files, include_sql_native=False, include_replayed=True):
+        offset = event["timestamp"].timestamp() - started_at
+        if 0 <= offset <= end:
+            counts[min(int(offset / bucket_seconds), buckets - 1)] += 1
+    return [count / bucket_seconds for count in counts]
+
+
+def _running_task_count(overlord_url: str) -> int | str:
+    endpoint = overlord_url.rstrip("/") + "/druid/indexer/v1/runningTasks"
+    try:
+        with urllib.request.urlopen(endpoint, timeout=5) as response:
+            return len(json.load(response))
+    except (urllib.error.URLError, OSError, ValueError):
+        return ""
+
+
+def _running_containers(compose_cmd: Sequence[str], repo_root: Path) -> List[str]:
+    result = subprocess.run(
+        list(compose_cmd) + ["ps", "--status", "running", "--format", "{{.Name}}"],
+        cwd=repo_root,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return sorted(line.strip() for line in result.stdout.splitlines() if line.strip())
+
+
+def _max_float(rows: Sequence[dict], key: str) -> float | None:
+    values = [float(row[key]) for row in rows if row[key]]
+    return max(values) if values else None
+
+
+def _resolve_compose_command() -> List[str] | None:
+    if shutil.which("docker"):
+        return ["docker", "compose"]
+    if shutil.which("docker-compose"):
+        return ["docker-compose"]
+    return None
+
+
+def log_heading(title: str, detail: str | None = None) -> None:
+    if detail:
+        print(f"\n==> {title}: {detail}")
+    else:
+        print(f"\n==> {title}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        raise SystemExit("Interrupted")
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""Scale the stack to N historicals and M middleManagers and measure how queries scale."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from regression_gate import load_suite, run_query, run_suite, wait_until_ready
+
+
+OVERRIDE_FILENAME = "compose.scale.yaml"
+# compose.yaml already defines historical-1/-2 and one middlemanager; extra nodes get
+# host ports in their own ranges so they never collide with the base services.
+BASE_HISTORICALS = 2
+BASE_MIDDLEMANAGERS = 1
+HISTORICAL_PORT_BASE = 8100
+MIDDLEMANAGER_PORT_BASE = 8200
+DISABLED_PROFILE = "scaled-down"
+# Per-node directories under druid-runtime/storage that the generated services write to.
+SCALED_STORAGE_GLOBS = ("segment-cache-historical-*", "task-middlemanager-*")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Generate a compose override with N historicals and M middleManagers reusing the "
+            "existing conf tree, bring each topology up, wait for segment balancing to settle, "
+            "and run a fixed query workload to produce a speedup/efficiency curve."
+        )
+    )
+    parser.add_argument(
+        "--historicals",
+        "-n",
+        default="1,2,4",
+        help="Comma-separated historical counts to measure, in order (default: 1,2,4).",
+    )
+    parser.add_argument(
+        "--middlemanagers",
+        "-m",
+        type=int,
+        default=BASE_MIDDLEMANAGERS,
+        help=f"Number of middleManagers in every topology (default: {BASE_MIDDLEMANAGERS}).",
+    )
+    parser.add_argument(
+        "--tier",
+        default="_default_tier",
+        help=(
+            "druid.server.tier for every historical (default: _default_tier). Other tiers "
+            "only receive segments if the datasource load rules name them."
+        ),
+    )
+    parser.add_argument(
+        "--generate-only",
+        action="store_true",
+        help=f"Write {OVERRIDE_FILENAME} for the first N and exit without touching Docker.",
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Leave the last topology running instead of restoring the stock compose.yaml stack.",
+    )
+    parser.add_argument(
+        "--router-url",
+        default="http://localhost:8888",
+        help="Base URL used to issue queries (default: http://localhost:8888).",
+    )
+    parser.add_argument(
+        "--broker-url",
+        default="http://localhost:8082",
+        help="Base URL polled for broker readiness (default: http://localhost:8082).",
+    )
+    parser.add_argument(
+        "--coordinator-url",
+        default="http://localhost:8081",
+        help="Base URL for the Druid Coordinator API (default: http://localhost:8081).",
+    )
+    parser.add_argument(
+        "--suite",
+        type=Path,
+        help="Query suite in the tools/regression_gate.py format (default: its built-in suite).",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=5,
+        help="Timed executions of each query per topology (default: 5).",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=3,
+        help="Untimed executions of each query after each topology settles (default: 3).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Concurrent clients for the throughput phase (default: 8).",
+    )
+    parser.add_argument(
+        "--settle-polls",
+        type=int,
+        default=3,
+        help="Consecutive unchanged coordinator polls that count as balanced (default: 3).",
+    )
+    parser.add_argument(
+        "--settle-timeout",
+        type=float,
+        default=1800.0,
+        help="Seconds to wait for each topology to balance (default: 1800).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write the JSON report (default: sessions/scale-out-<timestamp>.json).",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repo_root = Path(__file__).resolve().parent.parent
+    override_path = repo_root / OVERRIDE_FILENAME
+
+    try:
+        counts = [int(part) for part in args.historicals.split(",") if part.strip()]
+    except ValueError:
+        print(f"Invalid --historicals value: {args.historicals}", file=sys.stderr)
+        return 1
+    if not counts or min(counts) < 1 or args.middlemanagers < 1:
+        print("At least one historical and one middleManager are required.", file=sys.stderr)
+        return 1
+
+    if args.generate_only:
+        override_path.write_text(
+            generate_override(counts[0], args.middlemanagers, args.tier), encoding="utf-8"
+        )
+        print(f"Wrote {override_path} ({counts[0]} historical(s), {args.middlemanagers} middleManager(s)).")
+        disabled = _disabled_containers(counts[0])
+        if disabled:
+            print(
+                f"Profiles do not stop running containers; after `up -d` also run: "
+                f"docker rm -f {' '.join(disabled)}"
+            )
+        return 0
+
+    compose_cmd = _resolve_compose_command()
+    if compose_cmd is None:
+        print("docker compose is required to change the topology.", file=sys.stderr)
+        return 1
+
+    suite = load_suite(args.suite)
+    results: List[dict] = []
+    try:
+        for count in counts:
+            log_heading("Topology", f"{count} historical(s), {args.middlemanagers} middleManager(s)")
+            override_path.write_text(
+                generate_override(count, args.middlemanagers, args.tier), encoding="utf-8"
+            )
+            apply_topology(compose_cmd, repo_root, override_path, count)
+            settle_start = time.perf_counter()
+            wait_until_ready(args.broker_url, args.coordinator_url, args.settle_timeout)
+            wait_for_balance(args.coordinator_url, count, args.settle_polls, args.settle_timeout)
+            settle_seconds = time.perf_counter() - settle_start
+            print(f"  balanced after {settle_seconds:.0f}s")
+
+            medians = run_suite(
+                args.router_url, suite, args.warmup, args.iterations, random.Random(0)
+            )
+            throughput = measure_throughput(args.router_url, suite, args.concurrency, args.iterations)
+            latency = sum(medians.values())
+            print(f"  suite latency {latency * 1000:.1f} ms; throughput {throughput:.2f} queries/s")
+            results.append(
+                {
+                    "historicals": count,
+                    "settle_seconds": round(settle_seconds, 1),
+                    "suite_latency_ms": round(latency * 1000, 3),
+                    "throughput_qps": round(throughput, 3),
+                    "query_medians_ms": {name: round(value * 1000, 3) for name, value in medians.items()},
+                }
+            )
+    except RuntimeError as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+    finally:
+        if not args.keep:
+            log_heading("Restoring", "compose.yaml topology")
+            restore_topology(compose_cmd, repo_root)
+
+    add_scaling_curve(results)
+    log_heading("Scaling curve", f"relative to {results[0]['historicals']} historical(s)")
+    print(f"  {'N':>3} {'latency ms':>11} {'speedup':>8} {'eff':>6} {'q/s':>8} {'speedup':>8} {'eff':>6}")
+    for row in results:
+        print(
+            f"  {row['historicals']:>3} {row['suite_latency_ms']:>11.1f} {row['latency_speedup']:>8.2f} "
+            f"{row['latency_efficiency']:>6.2f} {row['throughput_qps']:>8.2f} "
+            f"{row['throughput_speedup']:>8.2f} {row['throughput_efficiency']:>6.2f}"
+        )
+
+    report = {
+        "middlemanagers": args.middlemanagers,
+        "tier": args.tier,
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "results": results,
+    }
+    output = args.output or (
+        repo_root / "sessions" / f"scale-out-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nReport written to {output}")
+    return 0
+
+
+def generate_override(historicals: int, middlemanagers: int, tier: str) -> str:
+    """Render a compose override that resizes the data tier to the requested node counts."""
+    lines = [
+        f"# Generated by tools/scale_out.py: {historicals} historical(s), "
+        f"{middlemanagers} middleManager(s). Use with:",
+        f"#   docker compose -f compose.yaml -f {OVERRIDE_FILENAME} up -d",
+    ]
+    disabled = _disabled_containers(historicals)
+    if disabled:
+        lines.append(f"#   docker rm -f {' '.join(disabled)}   # profiles do not stop running containers")
+    lines.append("services:")
+    for index in range(1, max(historicals, BASE_HISTORICALS) + 1):
+        service = f"historical-{index}"
+        environment = {
+            "druid_server_tier": tier,
+            "druid_segmentCache_locations": (
+                f'[{{"path":"var/druid/segment-cache-{service}","maxSize":"50g"}}]'
+            ),
+        }
+        if index <= BASE_HISTORICALS:
+            lines.append(_base_service_override(service, environment, disabled=index > historicals))
+        else:
+            lines.append(
+                _new_service(service, "historical-1", HISTORICAL_PORT_BASE + index, 8083, environment)
+            )
+    for index in range(BASE_MIDDLEMANAGERS + 1, middlemanagers + 1):
+        service = f"middlemanager-{index}"
+        environment = {"druid_worker_baseTaskDirs": f'["var/druid/task-{service}"]'}
+        lines.append(
+            _new_service(service, "middlemanager", MIDDLEMANAGER_PORT_BASE + index, 8091, environment)
+        )
+    return "\n".join(lines).rstrip("\n") + "\n"
+
+
+def _base_service_override(service: str, environment: Dict[str, str], disabled: bool) -> str:
+    lines = [f"  {service}:"]
+    if disabled:
+        lines.append(f'    profiles: ["{DISABLED_PROFILE}"]')
+    lines.append("    environment:")
+    lines.extend(f"      {key}: {_quote(value)}" for key, value in environment.items())
+    return "\n".join(lines)
+
+
+def _new_service(
+    service: str,
+    base_service: str,
+    host_port: int,
+    container_port: int,
+    environment: Dict[str, str],
+) -> str:
+    lines = [
+        f"  {service}:",
+        "    extends:",
+        "      file: compose.yaml",
+        f"      service: {base_service}",
+        f"    container_name: druid-{service}",
+        "    environment:",
+        f"      druid_host: {service}",
+    ]
+    lines.extend(f"      {key}: {_quote(value)}" for key, value in environment.items())
+    # Without !override the base service's host port would be merged in and collide.
+    lines.append("    ports: !override")
+    lines.append(f'      - "{host_port}:{container_port}"')
+    return "\n".join(lines)
+
+
+def apply_topology(
+    compose_cmd: Sequence[str],
+    repo_root: Path,
+    override_path: Path,
+    historicals: int,
+) -> None:
+    files = ["-f", "compose.yaml", "-f", override_path.name]
+    try:
+        subprocess.run(
+            list(compose_cmd) + files + ["up", "-d", "--remove-orphans"],
+            cwd=repo_root,
+            check=True,
+        )
+    except subprocess.CalledProcessError as exc:
+        raise RuntimeError(f"docker compose up failed with exit code {exc.returncode}") from exc
+    # Services disabled through a profile are skipped by `up` but keep running if they were.
+    for container in _disabled_containers(historicals):
+        subprocess.run(
+            ["docker", "rm", "-f", container],
+            cwd=repo_root,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+
+def restore_topology(compose_cmd: Sequence[str], repo_root: Path) -> None:
+    try:
+        subprocess.run(
+            list(compose_cmd) + ["-f", "compose.yaml", "up", "-d", "--remove-orphans"],
+            cwd=repo_root,
+            check=True,
+        )
+    except subprocess.CalledProcessError:
+        print(
+            "  warning: restoring the compose.yaml topology failed; run `docker compose up -d "
+            "--remove-orphans` manually.",
+            file=sys.stderr,
+        )
+        return
+    remove_scaled_storage(repo_root)
+
+
+def remove_scaled_storage(repo_root: Path) -> None:
+    """Delete the per-node segment caches and task dirs the generated services left behind."""
+    storage = repo_root / "druid-runtime" / "storage"
+    for pattern in SCALED_STORAGE_GLOBS:
+        for path in sorted(storage.glob(pattern)):
+            try:
+                shutil.rmtree(path)
+            except OSError as exc:
+                print(f"  warning: could not remove {path}: {exc}", file=sys.stderr)
+            else:
+                print(f"  removed {path.relative_to(repo_root)}")
+
+
+def wait_for_balance(coordinator_url: str, historicals: int, settle_polls: int, timeout: float) -> None:
+    """Wait until N historicals are serving, load queues are empty and sizes stop moving."""
+    deadline = time.monotonic() + timeout
+    previous = None
+    stable = 0
+    while True:
+        time.sleep(10.0)
+        try:
+            servers = _get_json(coordinator_url, "/druid/coordinator/v1/servers?simple") or []
+            queues = _get_json(coordinator_url, "/druid/coordinator/v1/loadqueue?simple") or {}
+        except RuntimeError:
+            servers, queues = [], {}
+        sizes = {
+            server["host"]: server.get("currSize", 0)
+            for server in servers
+            if server.get("type") == "historical"
+        }
+        pending = sum(
+            queue.get("segmentsToLoad", 0) + queue.get("segmentsToDrop", 0)
+            for queue in queues.values()
+        )
+        if len(sizes) == historicals and pending == 0 and sizes == previous:
+            stable += 1
+        else:
+            stable = 0
+        print(f"  {len(sizes)}/{historicals} historical(s), {pending} queued, stable {stable}/{settle_polls}")
+        if stable >= settle_polls:
+            return
+        previous = sizes
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Segments did not settle across {historicals} historical(s) within {timeout:.0f}s.")
+
+
+def measure_throughput(router_url: str, suite: Sequence[dict], concurrency: int, iterations: int) -> float:
+    """Run the suite ``iterations`` times on each of ``concurrency`` clients; return queries/s."""
+    completed = 0
+    lock = threading.Lock()
+
+    def client() -> None:
+        nonlocal completed
+        for _ in range(iterations):
+            for entry in suite:
+                run_query(router_url, entry)
+                with lock:
+                    completed += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        for future in [pool.submit(client) for _ in range(max(concurrency, 1))]:
+            future.result()
+    return completed / (time.perf_counter() - start)
+
+
+def add_scaling_curve(results: List[dict]) -> None:
+    base = results[0]
+    for row in results:
+        nodes_ratio = row["historicals"] / base["historicals"]
+        latency_speedup = base["suite_latency_ms"] / row["suite_latency_ms"]
+        throughput_speedup = row["throughput_qps"] / base["throughput_qps"]
+        row["latency_speedup"] = round(latency_speedup, 3)
+        row["latency_efficiency"] = round(latency_speedup / nodes_ratio, 3)
+        row["throughput_speedup"] = round(throughput_speedup, 3)
+        row["throughput_efficiency"] = round(throughput_speedup / nodes_ratio, 3)
+
+
+def _disabled_containers(historicals: int) -> List[str]:
+    return [f"druid-historical-{index}" for index in range(historicals + 1, BASE_HISTORICALS + 1)]
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _get_json(base_url: str, path: str):
+    endpoint = base_url.rstrip("/") + path
+    try:
+        with urllib.request.urlopen(endpoint, timeout=30) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as exc:
+        details = exc.read().decode("utf-8", "replace")
+        raise RuntimeError(f"Request to {endpoint} failed ({exc.code}): {details}") from exc
+    except (urllib.error.URLError, ValueError) as exc:
+        raise RuntimeError(f"Request to {endpoint} failed: {exc}") from exc
+
+
+def _resolve_compose_command() -> List[str] | None:
+    if shutil.which("docker"):
+        return ["docker", "compose"]
+    if shutil.which("docker-compose"):
+        return ["docker-compose"]
+    return None
+
+
+def log_heading(title: str, detail: str | None = None) -> None:
+    if detail:
+        print(f"\n==> {title}: {detail}")
+    else:
+        print(f"\n==> {title}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        raise SystemExit("Interrupted")
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""Compact small segments and kill overshadowed versions to keep the dev stack lean."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+
+DEFAULT_TARGET_SEGMENT_BYTES = 500 * 1024 * 1024
+DEFAULT_MAX_ROWS_PER_SEGMENT = 5_000_000
+DEEP_STORAGE_RELATIVE_PATH = Path("druid-runtime") / "storage" / "segments"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Submit auto-compaction configs that target a segment size, mark overshadowed "
+            "segments unused, and issue kill tasks so repeated re-ingestion does not pile up "
+            "segments in the metadata store and deep storage."
+        )
+    )
+    parser.add_argument(
+        "--datasource",
+        "-d",
+        action="append",
+        metavar="NAME",
+        help=(
+            "Datasource(s) to clean up. Accepts repeated flags or comma-separated values. "
+            "Defaults to every datasource known to the coordinator."
+        ),
+    )
+    parser.add_argument(
+        "--coordinator-url",
+        default="http://localhost:8081",
+        help="Base URL for the Druid Coordinator API (default: http://localhost:8081).",
+    )
+    parser.add_argument(
+        "--overlord-url",
+        default="http://localhost:8090",
+        help="Base URL for the Druid Overlord API (default: http://localhost:8090).",
+    )
+    parser.add_argument(
+        "--broker-url",
+        default="http://localhost:8082",
+        help="Base URL for the Druid Broker SQL API (default: http://localhost:8082).",
+    )
+    parser.add_argument(
+        "--target-segment-bytes",
+        type=int,
+        default=DEFAULT_TARGET_SEGMENT_BYTES,
+        help=(
+            "Approximate size compaction should aim for per segment. Converted to "
+            f"maxRowsPerSegment from the observed bytes per row (default: {DEFAULT_TARGET_SEGMENT_BYTES})."
+        ),
+    )
+    parser.add_argument(
+        "--skip-compaction",
+        action="store_true",
+        help="Do not submit compaction configs; only clean up overshadowed segments.",
+    )
+    parser.add_argument(
+        "--skip-kill",
+        action="store_true",
+        help=(
+            "Mark overshadowed segments unused but do not submit kill tasks. Kill tasks "
+            "permanently delete every unused segment of the datasource, including ones the "
+            "coordinator marked unused before this run, from the metadata store and deep storage."
+        ),
+    )
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help=(
+            "Wait for compaction to catch up before cleaning up, and for kill tasks to finish "
+            "before reporting the after state."
+        ),
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between status checks when --wait is supplied (default: 10).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=1800.0,
+        help="Give up waiting for compaction after this many seconds (default: 1800).",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report the current state and planned actions without changing anything.",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repo_root = Path(__file__).resolve().parent.parent
+    deep_storage = repo_root / DEEP_STORAGE_RELATIVE_PATH
+
+    datasources = _resolve_datasources(args.coordinator_url, args.datasource)
+    if not datasources:
+        print("No datasources found; nothing to clean up.", file=sys.stderr)
+        return 1
+
+    log_heading("Collecting before state", ", ".join(datasources))
+    before = collect_state(args, datasources, deep_storage)
+    print_state(before)
+
+    compaction: Dict[str, dict] = {}
+    if not args.skip_compaction:
+        log_heading("Submitting compaction configs", f"target {args.target_segment_bytes} bytes")
+        if not args.dry_run:
+            set_compaction_task_slots(args.coordinator_url)
+        for datasource in datasources:
+            config = build_compaction_config(
+                datasource,
+                before["datasources"].get(datasource, {}),
+                args.target_segment_bytes,
+            )
+            compaction[datasource] = config
+            max_rows = config["tuningConfig"]["partitionsSpec"]["maxRowsPerSegment"]
+            if args.dry_run:
+                print(f"  dry-run: would submit compaction for {datasource} (maxRowsPerSegment={max_rows})")
+                continue
+            request_json("POST", args.coordinator_url, "/druid/coordinator/v1/config/compaction", config)
+            print(f"  submitted compaction for {datasource} (maxRowsPerSegment={max_rows})")
+        if not args.dry_run:
+            request_json("POST", args.coordinator_url, "/druid/coordinator/v1/compaction/compact")
+            if args.wait:
+                wait_for_compaction(args, datasources)
+
+    # The coordinator's own duty usually marks overshadowed segments unused within one
+    # period, so this mostly catches what the broker's sys.segments view still shows.
+    log_heading("Marking overshadowed segments unused")
+    marked: Dict[str, int] = {}
+    for datasource in datasources:
+        segment_ids = overshadowed_segments(args.broker_url, datasource)
+        marked[datasource] = len(segment_ids)
+        if not segment_ids:
+            print(f"  {datasource}: no overshadowed segments")
+            continue
+        if args.dry_run:
+            print(f"  dry-run: would mark {len(segment_ids)} segment(s) unused in {datasource}")
+            continue
+        path = f"/druid/coordinator/v1/datasources/{_quote(datasource)}/markUnused"
+        request_json("POST", args.coordinator_url, path, {"segmentIds": segment_ids})
+        print(f"  {datasource}: marked {len(segment_ids)} segment(s) unused")
+
+    kill_tasks: Dict[str, str] = {}
+    if not args.skip_kill:
+        log_heading("Submitting kill tasks", "unused segments from the coordinator metadata store")
+        for datasource in datasources:
+            segments = unused_segments(args.coordinator_url, datasource)
+            if not segments:
+                print(f"  {datasource}: no unused segments")
+                continue
+            # A kill task only deletes unused segments, so one interval spanning all of them
+            # removes exactly this set and leaves used segments in between untouched.
+            interval = _covering_interval(segments)
+            if args.dry_run:
+                print(f"  dry-run: would kill {len(segments)} unused segment(s) in {datasource} {interval}")
+                continue
+            task_id = submit_kill_task(args.overlord_url, datasource, interval)
+            kill_tasks[datasource] = task_id
+            print(f"  {datasource}: submitted {task_id} for {len(segments)} unused segment(s) in {interval}")
+        if args.wait:
+            for datasource, task_id in kill_tasks.items():
+                status = wait_for_task(args.overlord_url, task_id, args.poll_interval)
+                print(f"  {datasource}: {task_id} finished with status {status}")
+
+    log_heading("Collecting after state")
+    after = collect_state(args, datasources, deep_storage)
+    print_state(after)
+
+    status = {
+        "datasources": datasources,
+        "before": before,
+        "after": after,
+        "compaction_configs": compaction,
+        "segments_marked_unused": marked,
+        "kill_tasks": kill_tasks,
+        "dry_run": args.dry_run,
+    }
+    print(json.dumps(status, indent=2))
+    return 0
+
+
+def collect_state(args: argparse.Namespace, datasources: Sequence[str], deep_storage: Path) -> dict:
+    quoted = ", ".join("'" + name.replace("'", "''") + "'" for name in datasources)
+    rows = run_sql(
+        args.broker_url,
+        'SELECT "datasource", COUNT(*) AS "segments", '
+        'SUM(CASE WHEN "is_overshadowed" = 1 THEN 1 ELSE 0 END) AS "overshadowed", '
+        'SUM("size") AS "bytes", '
+        'SUM(CASE WHEN "is_overshadowed" = 0 THEN "size" ELSE 0 END) AS "live_bytes", '
+        'SUM(CASE WHEN "is_overshadowed" = 0 THEN "num_rows" ELSE 0 END) AS "live_rows" '
+        'FROM sys.segments WHERE "is_published" = 1 '
+        f'AND "datasource" IN ({quoted}) GROUP BY 1',
+    )
+    per_datasource = {row["datasource"]: {k: v for k, v in row.items() if k != "datasource"} for row in rows}
+    # sys.segments only lists used segments; unused rows stay in postgres until a kill task.
+    for datasource in datasources:
+        unused = unused_segments(args.coordinator_url, datasource)
+        row = per_datasource.setdefault(
+            datasource, {"segments": 0, "overshadowed": 0, "bytes": 0, "live_bytes": 0, "live_rows": 0}
+        )
+        row["unused_segments"] = len(unused)
+        row["unused_bytes"] = sum(segment.get("size", 0) for segment in unused)
+
+    # The segment metadata snapshot is the work every coordinator cycle and historical
+    # startup scales with, so time serving it next to the duty run times.
+    start = time.perf_counter()
+    segments = request_json(
+        "GET",
+        args.coordinator_url,
+        "/druid/coordinator/v1/metadata/segments?includeOvershadowedStatus",
+    )
+    coordinator_seconds = time.perf_counter() - start
+
+    return {
+        "datasources": per_datasource,
+        "total_segments": sum(row["segments"] for row in per_datasource.values()),
+        "total_bytes": sum(row["bytes"] for row in per_datasource.values()),
+        "total_unused_segments": sum(row["unused_segments"] for row in per_datasource.values()),
+        "total_unused_bytes": sum(row["unused_bytes"] for row in per_datasource.values()),
+        "cluster_used_segments": len(segments or []),
+        "coordinator_metadata_seconds": round(coordinator_seconds, 3),
+        "coordinator_duty_seconds": coordinator_duty_seconds(args.coordinator_url),
+        "deep_storage_files": _count_files(deep_storage, datasources),
+        "deep_storage_bytes": _directory_bytes(deep_storage, datasources),
+    }
+
+
+def print_state(state: dict) -> None:
+    for datasource, row in sorted(state["datasources"].items()):
+        print(
+            f"  {datasource}: {row['segments']} segment(s), {row['overshadowed']} overshadowed, "
+            f"{row['bytes']} bytes; {row['unused_segments']} unused segment(s), {row['unused_bytes']} bytes"
+        )
+    print(
+        f"  total: {state['total_segments']} segment(s), {state['total_bytes']} bytes; "
+        f"unused: {state['total_unused_segments']} segment(s), {state['total_unused_bytes']} bytes; "
+        f"deep storage: {state['deep_storage_files']} file(s), {state['deep_storage_bytes']} bytes; "
+        f"coordinator metadata fetch: {state['coordinator_metadata_seconds']}s"
+    )
+    for group, seconds in sorted(state["coordinator_duty_seconds"].items()):
+        print(f"  coordinator run {group}: {seconds}s")
+
+
+def build_compaction_config(datasource: str, stats: dict, target_segment_bytes: int) -> dict:
+    live_rows = stats.get("live_rows") or 0
+    live_bytes = stats.get("live_bytes") or 0
+    if live_rows > 0 and live_bytes > 0:
+        bytes_per_row = live_bytes / live_rows
+        max_rows = max(int(target_segment_bytes / bytes_per_row), 1)
+    else:
+        max_rows = DEFAULT_MAX_ROWS_PER_SEGMENT
+    return {
+        "dataSource": datasource,
+        # Sandbox data is loaded in batches, so there is no recent interval worth protecting.
+        "skipOffsetFromLatest": "PT0S",
+        "tuningConfig": {
+            "partitionsSpec": {
+                "type": "dynamic",
+                "maxRowsPerSegment": max_rows,
+            },
+        },
+    }
+
+
+def set_compaction_task_slots(coordinator_url: str) -> None:
+    # The default 10% slot ratio rounds down to zero on a single two-slot middleManager.
+    request_json(
+        "POST",
+        coordinator_url,
+        "/druid/coordinator/v1/config/compaction/taskslots?ratio=0.5&max=1",
+    )
+
+
+def wait_for_compaction(args: argparse.Namespace, datasources: Sequence[str]) -> None:
+    deadline = time.monotonic() + args.timeout
+    pending = set(datasources)
+    while pending:
+        time.sleep(max(args.poll_interval, 1.0))
+        request_json("POST", args.coordinator_url, "/druid/coordinator/v1/compaction/compact")
+        for datasource in sorted(pending):
+            path = f"/druid/coordinator/v1/compaction/status?dataSource={_quote(datasource)}"
+            try:
+                payload = request_json("GET", args.coordinator_url, path)
+            except RuntimeError:
+                continue
+            statuses = (payload or {}).get("latestStatus") or []
+            awaiting = sum(entry.get("bytesAwaitingCompaction", 0) for entry in statuses)
+            print(f"  {datasource}: {awaiting} bytes awaiting compaction")
+            if statuses and awaiting == 0:
+                pending.discard(datasource)
+        if pending and time.monotonic() > deadline:
+            print(
+                f"  warning: compaction still pending for {', '.join(sorted(pending))}; "
+                "continuing with what has been compacted so far.",
+                file=sys.stderr,
+            )
+            return
+
+
+def overshadowed_segments(broker_url: str, datasource: str) -> List[str]:
+    rows = run_sql(
+        broker_url,
+        'SELECT "segment_id" FROM sys.segments '
+        'WHERE "is_published" = 1 AND "is_overshadowed" = 1 AND "datasource" = '
+        + "'" + datasource.replace("'", "''") + "'",
+    )
+    return [row["segment_id"] for row in rows]
+
+
+def unused_segments(coordinator_url: str, datasource: str) -> List[dict]:
+    """Return every segment of ``datasource`` the metadata store holds as unused."""
+    path = f"/druid/coordinator/v1/metadata/datasources/{_quote(datasource)}/unusedSegments"
+    payload = request_json("GET", coordinator_url, path) or []
+    # Newer releases wrap each segment together with its used-status timestamps.
+    return [entry.get("dataSegment", entry) for entry in payload]
+
+
+def coordinator_duty_seconds(coordinator_url: str) -> Dict[str, float]:
+    """Return how long the latest run of each coordinator duty group took."""
+    groups = request_json("GET", coordinator_url, "/druid/coordinator/v1/duties") or []
+    timings: Dict[str, float] = {}
+    for group in groups:
+        start = _parse_timestamp(group.get("latestRunStartTime") or group.get("lastRunStart"))
+        end = _parse_timestamp(group.get("latestRunEndTime") or group.get("lastRunEnd"))
+        # The end time still belongs to the previous run while a run is in progress.
+        if start is not None and end is not None and end >= start:
+            timings[group.get("name", "unknown")] = round((end - start).total_seconds(), 3)
+    return timings
+
+
+def submit_kill_task(overlord_url: str, datasource: str, interval: str) -> str:
+    payload = request_json(
+        "POST",
+        overlord_url,
+        "/druid/indexer/v1/task",
+        {"type": "kill", "dataSource": datasource, "interval": interval},
+    )
+    task_id = (payload or {}).get("task")
+    if not task_id:
+        raise RuntimeError(f"Unexpected response payload: {payload}")
+    return task_id
+
+
+def wait_for_task(base_url: str, task_id: str, poll_interval: float) -> str:
+    path = f"/druid/indexer/v1/task/{_quote(task_id)}/status"
+    while True:
+        time.sleep(max(poll_interval, 1.0))
+        payload = request_json("GET", base_url, path)
+        status = (payload or {}).get("status", {}).get("status")
+        if status in {"SUCCESS", "FAILED"}:
+            return status
+
+
+def run_sql(broker_url: str, query: str) -> List[dict]:
+    return request_json(
+        "POST",
+        broker_url,
+        "/druid/v2/sql",
+        {"query": query, "resultFormat": "object"},
+    ) or []
+
+
+def request_json(method: str, base_url: str, path: str, body: object | None = None):
+    endpoint = base_url.rstrip("/") + path
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(
+        endpoint,
+        data=data,
+        headers={"Content-Type": "application/json"},
+        method=method,
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            raw = response.read()
+    except urllib.error.HTTPError as exc:
+        details = exc.read().decode("utf-8", "replace")
+        raise RuntimeError(f"{method} {endpoint} failed ({exc.code}): {details}") from exc
+    except urllib.error.URLError as exc:
+        raise RuntimeError(f"{method} {endpoint} failed: {exc}") from exc
+    if not raw.strip():
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return raw.decode("utf-8", "replace")
+
+
+def _resolve_datasources(coordinator_url: str, requested: Sequence[str] | None) -> List[str]:
+    if requested:
+        names: List[str] = []
+        for part in requested:
+            for name in part.split(","):
+                name = name.strip()
+                if name and name not in names:
+                    names.append(name)
+        return names
+    payload = request_json("GET", coordinator_url, "/druid/coordinator/v1/datasources")
+    return sorted(payload or [])
+
+
+def _count_files(deep_storage: Path, datasources: Sequence[str]) -> int:
+    return sum(
+        1
+        for datasource in datasources
+        if (deep_storage / datasource).exists()
+        for path in (deep_storage / datasource).rglob("*")
+        if path.is_file()
+    )
+
+
+def _directory_bytes(deep_storage: Path, datasources: Sequence[str]) -> int:
+    return sum(
+        path.stat().st_size
+        for datasource in datasources
+        if (deep_storage / datasource).exists()
+        for path in (deep_storage / datasource).rglob("*")
+        if path.is_file()
+    )
+
+
+def _covering_interval(segments: Sequence[dict]) -> str:
+    # Druid serializes interval bounds as UTC ISO-8601 with fixed precision, so they sort as text.
+    bounds = [segment["interval"].split("/") for segment in segments]
+    return f"{min(start for start, _ in bounds)}/{max(end for _, end in bounds)}"
+
+
+def _parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _quote(value: str) -> str:
+    return urllib.parse.quote(value, safe="")
+
+
+def log_heading(title: str, detail: str | None = None) -> None:
+    if detail:
+        print(f"\n==> {title}: {detail}")
+    else:
+        print(f"\n==> {title}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except RuntimeError as exc:
+        print(str(exc), file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        raise SystemExit("Interrupted")
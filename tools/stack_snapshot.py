@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""Snapshot and restore the ingested state of the dev stack (metadata, deep storage, segment cache)."""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+
+STORAGE_RELATIVE_PATH = Path("druid-runtime") / "storage"
+SNAPSHOTS_RELATIVE_PATH = Path("druid-runtime") / "snapshots"
+# Directories under druid-runtime/storage that together make up a queryable stack.
+CAPTURED_DIRECTORIES = ("postgres", "segments", "segment-cache")
+CHUNK_SIZE = 1024 * 1024
+SUDO_HINT = "The postgres data directory is owned by the container user; re-run this command with sudo."
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Capture the postgres data directory, deep storage segments and historical "
+            "segment cache into a deduplicated, compressed snapshot while the stack is "
+            "stopped, or restore one in parallel to skip re-running ingestion."
+        )
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 4,
+        help="Number of files to compress or unpack concurrently (default: CPU count).",
+    )
+    common.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show the actions that would be performed without making changes.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = subparsers.add_parser(
+        "snapshot", parents=[common], help="Capture the current stack state."
+    )
+    snapshot.add_argument(
+        "name",
+        nargs="?",
+        help="Snapshot name (default: UTC timestamp).",
+    )
+    snapshot.add_argument(
+        "--no-restart",
+        action="store_true",
+        help="Leave the stack stopped after the snapshot is written.",
+    )
+
+    restore = subparsers.add_parser(
+        "restore", parents=[common], help="Replace the stack state with a snapshot."
+    )
+    restore.add_argument("name", help="Snapshot name to restore.")
+    restore.add_argument(
+        "--no-start",
+        action="store_true",
+        help="Do not run `docker compose up -d` after restoring.",
+    )
+
+    subparsers.add_parser("list", help="List available snapshots.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repo_root = Path(__file__).resolve().parent.parent
+    storage_root = repo_root / STORAGE_RELATIVE_PATH
+    snapshots_dir = repo_root / SNAPSHOTS_RELATIVE_PATH
+
+    if args.command == "list":
+        return list_snapshots(snapshots_dir)
+    if args.command == "snapshot":
+        return take_snapshot(args, repo_root, storage_root, snapshots_dir)
+    return restore_snapshot(args, repo_root, storage_root, snapshots_dir)
+
+
+def take_snapshot(
+    args: argparse.Namespace,
+    repo_root: Path,
+    storage_root: Path,
+    snapshots_dir: Path,
+) -> int:
+    name = args.name or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    manifest_path = snapshots_dir / f"{name}.json"
+    if manifest_path.exists():
+        print(f"Snapshot {name} already exists at {manifest_path}.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    log_heading("Stopping Docker", "docker compose stop")
+    running = stop_stack(repo_root, dry_run=args.dry_run)
+
+    try:
+        log_heading("Scanning", ", ".join(CAPTURED_DIRECTORIES))
+        entries = scan_entries(storage_root)
+        files = [entry for entry in entries if entry["type"] == "file"]
+        total_bytes = sum(entry["size"] for entry in files)
+        print(f"  {len(files)} file(s), {total_bytes} bytes")
+
+        log_heading("Compressing", f"{args.jobs} worker(s)")
+        blobs_dir = snapshots_dir / "blobs"
+        new_blobs = 0
+        if args.dry_run:
+            print(f"  dry-run: would write blobs to {blobs_dir}")
+        else:
+            blobs_dir.mkdir(parents=True, exist_ok=True)
+            claimed: set = set()
+            lock = threading.Lock()
+            with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+                results = pool.map(
+                    lambda entry: store_blob(storage_root / entry["path"], blobs_dir, claimed, lock),
+                    files,
+                )
+                for entry, (digest, created) in zip(files, results):
+                    entry["sha256"] = digest
+                    new_blobs += int(created)
+            manifest = {
+                "name": name,
+                "created": datetime.now(timezone.utc).isoformat(),
+                "directories": list(CAPTURED_DIRECTORIES),
+                "entries": entries,
+            }
+            manifest_path.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+            print(f"  wrote {manifest_path}; {new_blobs} new blob(s), {len(files) - new_blobs} deduplicated")
+    finally:
+        if not args.no_restart:
+            log_heading("Starting Docker", "docker compose start")
+            start_stack(repo_root, running, dry_run=args.dry_run)
+
+    status = {
+        "snapshot": name,
+        "files": len(files),
+        "bytes": total_bytes,
+        "new_blobs": new_blobs,
+        "archive_bytes": _directory_bytes(blobs_dir),
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+        "dry_run": args.dry_run,
+    }
+    print(json.dumps(status, indent=2))
+    return 0
+
+
+def restore_snapshot(
+    args: argparse.Namespace,
+    repo_root: Path,
+    storage_root: Path,
+    snapshots_dir: Path,
+) -> int:
+    manifest_path = snapshots_dir / f"{args.name}.json"
+    if not manifest_path.exists():
+        print(f"Snapshot {args.name} not found at {manifest_path}.", file=sys.stderr)
+        return 1
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    entries: List[dict] = manifest["entries"]
+    blobs_dir = snapshots_dir / "blobs"
+
+    missing = [
+        entry["path"]
+        for entry in entries
+        if entry["type"] == "file" and not _blob_path(blobs_dir, entry["sha256"]).exists()
+    ]
+    if missing:
+        print(
+            f"Snapshot {args.name} references {len(missing)} missing blob(s), e.g. {missing[0]}.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if not args.dry_run:
+        # Fail before stopping the stack rather than halfway through clearing it.
+        _check_removable(storage_root, manifest["directories"])
+
+    start = time.perf_counter()
+    log_heading("Stopping Docker", "docker compose stop")
+    stop_stack(repo_root, dry_run=args.dry_run)
+
+    log_heading("Clearing", ", ".join(manifest["directories"]))
+    for directory in manifest["directories"]:
+        target = storage_root / directory
+        if args.dry_run:
+            print(f"  dry-run: would remove {target}")
+        elif target.exists():
+            shutil.rmtree(target)
+            print(f"  removed {target}")
+
+    files = [entry for entry in entries if entry["type"] == "file"]
+    log_heading("Unpacking", f"{len(files)} file(s) with {args.jobs} worker(s)")
+    if args.dry_run:
+        print(f"  dry-run: would unpack into {storage_root}")
+    else:
+        # Directories first so workers never race on parent creation; owners and modes are
+        # applied last because postgres keeps its data directory at 0700.
+        directories = [entry for entry in entries if entry["type"] == "dir"]
+        for entry in directories:
+            (storage_root / entry["path"]).mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+            list(pool.map(lambda entry: extract_blob(blobs_dir, storage_root, entry), files))
+        for entry in entries:
+            if entry["type"] == "symlink":
+                os.symlink(entry["target"], storage_root / entry["path"])
+                _restore_owner(storage_root / entry["path"], entry)
+        for entry in sorted(directories, key=lambda item: item["path"], reverse=True):
+            _restore_owner(storage_root / entry["path"], entry)
+            os.chmod(storage_root / entry["path"], entry["mode"])
+
+    if not args.no_start:
+        log_heading("Starting Docker", "docker compose up -d")
+        up_stack(repo_root, dry_run=args.dry_run)
+
+    status = {
+        "snapshot": args.name,
+        "files": len(files),
+        "bytes": sum(entry["size"] for entry in files),
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+        "dry_run": args.dry_run,
+    }
+    print(json.dumps(status, indent=2))
+    return 0
+
+
+def list_snapshots(snapshots_dir: Path) -> int:
+    manifests = sorted(snapshots_dir.glob("*.json")) if snapshots_dir.exists() else []
+    if not manifests:
+        print(f"No snapshots under {snapshots_dir}.")
+        return 0
+    for manifest_path in manifests:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        files = [entry for entry in manifest["entries"] if entry["type"] == "file"]
+        size = sum(entry["size"] for entry in files)
+        print(f"{manifest['name']}\t{manifest['created']}\t{len(files)} file(s)\t{size} bytes")
+    print(f"blob store: {_directory_bytes(snapshots_dir / 'blobs')} bytes")
+    return 0
+
+
+def scan_entries(storage_root: Path) -> List[dict]:
+    entries: List[dict] = []
+    for directory in CAPTURED_DIRECTORIES:
+        base = storage_root / directory
+        if not base.exists():
+            print(f"  warning: {base} does not exist; skipping")
+            continue
+        try:
+            for root, dirnames, filenames in os.walk(base, onerror=_raise):
+                root_path = Path(root)
+                entries.append(_entry(storage_root, root_path, "dir"))
+                for name in sorted(dirnames):
+                    path = root_path / name
+                    if path.is_symlink():
+                        entries.append(_entry(storage_root, path, "symlink"))
+                for name in sorted(filenames):
+                    path = root_path / name
+                    kind = "symlink" if path.is_symlink() else "file"
+                    entries.append(_entry(storage_root, path, kind))
+        except PermissionError as exc:
+            raise SystemExit(f"Cannot read {exc.filename}. {SUDO_HINT}") from exc
+    return entries
+
+
+def _check_removable(storage_root: Path, directories: Sequence[str]) -> None:
+    """Exit with the sudo hint unless every directory a restore clears can be removed."""
+    if os.geteuid() == 0:
+        return
+    for directory in directories:
+        target = storage_root / directory
+        if not target.exists():
+            continue
+        if not os.access(storage_root, os.W_OK | os.X_OK):
+            raise SystemExit(f"Cannot remove {target}. {SUDO_HINT}")
+        try:
+            for root, _, _ in os.walk(target, onerror=_raise):
+                if not os.access(root, os.W_OK | os.X_OK):
+                    raise SystemExit(f"Cannot remove {root}. {SUDO_HINT}")
+        except PermissionError as exc:
+            raise SystemExit(f"Cannot remove {exc.filename}. {SUDO_HINT}") from exc
+
+
+def store_blob(source: Path, blobs_dir: Path, claimed: set, lock: threading.Lock) -> tuple[str, bool]:
+    """Compress ``source`` into the content-addressed blob store, returning (digest, created).
+
+    The file is hashed first so unchanged content is never recompressed; ``claimed`` holds
+    the digests other workers of the same snapshot are already writing.
+    """
+    digest = hashlib.sha256()
+    with source.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    hexdigest = digest.hexdigest()
+    destination = _blob_path(blobs_dir, hexdigest)
+    with lock:
+        if hexdigest in claimed or destination.exists():
+            return hexdigest, False
+        claimed.add(hexdigest)
+
+    fd, temp_name = tempfile.mkstemp(dir=blobs_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as out:
+            with source.open("rb") as handle:
+                shutil.copyfileobj(handle, out, CHUNK_SIZE)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_name, destination)
+        return hexdigest, True
+    finally:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+
+
+def extract_blob(blobs_dir: Path, storage_root: Path, entry: dict) -> None:
+    destination = storage_root / entry["path"]
+    with gzip.open(_blob_path(blobs_dir, entry["sha256"]), "rb") as source, destination.open("wb") as out:
+        shutil.copyfileobj(source, out, CHUNK_SIZE)
+    _restore_owner(destination, entry)
+    os.chmod(destination, entry["mode"])
+    os.utime(destination, (entry["mtime"], entry["mtime"]))
+
+
+def stop_stack(repo_root: Path, dry_run: bool = False) -> List[str]:
+    compose_cmd = _resolve_compose_command()
+    if compose_cmd is None:
+        print(
+            "  warning: docker compose not available; make sure the stack is stopped.",
+            file=sys.stderr,
+        )
+        return []
+    try:
+        running = _list_compose_services(compose_cmd, repo_root, ["--status", "running"])
+    except subprocess.CalledProcessError:
+        running = []
+    if dry_run:
+        print(f"  dry-run: would stop {', '.join(running) or 'nothing'}")
+        return running
+    if running:
+        subprocess.run(compose_cmd + ["stop"], cwd=repo_root, check=True)
+    return running
+
+
+def start_stack(repo_root: Path, services: Sequence[str], dry_run: bool = False) -> None:
+    compose_cmd = _resolve_compose_command()
+    if compose_cmd is None or not services:
+        return
+    if dry_run:
+        print(f"  dry-run: would start {', '.join(services)}")
+        return
+    subprocess.run(compose_cmd + ["start", *services], cwd=repo_root, check=True)
+
+
+def up_stack(repo_root: Path, dry_run: bool = False) -> None:
+    compose_cmd = _resolve_compose_command()
+    if compose_cmd is None:
+        print(
+            "  warning: docker compose not available; start the stack manually.",
+            file=sys.stderr,
+        )
+        return
+    if dry_run:
+        print("  dry-run: skipping docker compose up -d")
+        return
+    subprocess.run(compose_cmd + ["up", "-d"], cwd=repo_root, check=True)
+
+
+def _list_compose_services(
+    compose_cmd: Sequence[str],
+    repo_root: Path,
+    extra_args: Sequence[str] = (),
+) -> List[str]:
+    result = subprocess.run(
+        list(compose_cmd) + ["ps", "--services", *extra_args],
+        cwd=repo_root,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+def _resolve_compose_command() -> List[str] | None:
+    if shutil.which("docker"):
+        return ["docker", "compose"]
+    if shutil.which("docker-compose"):
+        return ["docker-compose"]
+    return None
+
+
+def _entry(storage_root: Path, path: Path, kind: str) -> dict:
+    info = path.lstat()
+    entry: Dict[str, object] = {
+        "path": path.relative_to(storage_root).as_posix(),
+        "type": kind,
+        "mode": info.st_mode & 0o7777,
+        "uid": info.st_uid,
+        "gid": info.st_gid,
+    }
+    if kind == "file":
+        entry["size"] = info.st_size
+        entry["mtime"] = info.st_mtime
+    elif kind == "symlink":
+        entry["target"] = os.readlink(path)
+    return entry
+
+
+def _restore_owner(path: Path, entry: dict) -> None:
+    # Under sudo everything would otherwise be recreated as root, leaving the non-root
+    # druid user unable to write to deep storage or the segment cache.
+    if os.geteuid() != 0 or "uid" not in entry:
+        return
+    if entry["type"] == "symlink":
+        os.lchown(path, entry["uid"], entry["gid"])
+    else:
+        os.chown(path, entry["uid"], entry["gid"])
+
+
+def _blob_path(blobs_dir: Path, digest: str) -> Path:
+    return blobs_dir / digest[:2] / f"{digest}.gz"
+
+
+def _directory_bytes(directory: Path) -> int:
+    if not directory.exists():
+        return 0
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
+
+
+def _raise(exc: OSError) -> None:
+    raise exc
+
+
+def log_heading(title: str, detail: str | None = None) -> None:
+    if detail:
+        print(f"\n==> {title}: {detail}")
+    else:
+        print(f"\n==> {title}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        raise SystemExit("Interrupted")